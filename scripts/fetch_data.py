@@ -5,31 +5,426 @@ Automatically downloads NYC property sales data using the official API
 """
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import islice
 from pathlib import Path
+import hashlib
+import json
 import logging
+import os
+import random
+import shutil
+import threading
 import time
 
+try:
+    import brotli  # noqa: F401 - lets urllib3 decode Content-Encoding: br
+    ACCEPT_ENCODING = "br, gzip, deflate"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Page column dtypes. The Arrow schema handed to pyarrow's CSV reader is derived
+# from them, so every page parses straight into the same Parquet schema.
+DTYPES = {
+    'borough': 'string',
+    'neighborhood': 'string',
+    'building_class_category': 'string',
+    'address': 'string',
+    'apartment_number': 'string',
+    'zip_code': 'string',
+    'sale_date': 'datetime64[ms]',
+}
+
+# Numeric columns, coerced and stored in the narrowest type that fits the data.
+# Nullable and fixed (not per-page downcasts) so every page shares one schema.
+NUMERIC_DTYPES = {
+    'sale_price': 'float64',  # kept wide for dollar precision
+    'tax_class_at_time_of_sale': 'Int8',
+    'block': 'Int32',
+    'lot': 'Int32',
+    'residential_units': 'Int32',
+    'commercial_units': 'Int32',
+    'total_units': 'Int32',
+    'year_built': 'Int16',
+    'land_square_feet': 'Int32',
+    'gross_square_feet': 'Int32',
+}
+
+# Low-cardinality columns converted to category once all pages are combined
+# (per-page categoricals with different categories would concat to object)
+CATEGORY_COLUMNS = ['borough', 'zip_code', 'neighborhood', 'building_class_category']
+
+class AdaptiveLimiter:
+    """
+    Adaptive rate limiter shared by the page-fetch threads
+    
+    Concurrency follows AIMD: a throttled request (HTTP 429) halves the number
+    of requests allowed in flight, each success grows it back by one. On top of
+    that, all threads pause when the API says so - Retry-After on a 429 (or an
+    exponential backoff with jitter when absent), or X-RateLimit-Remaining
+    running low until X-RateLimit-Reset.
+    """
+    def __init__(self, max_limit=8, min_limit=1, base_delay=0.5, max_delay=30, low_remaining=5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_remaining = low_remaining
+        self._in_flight = 0
+        self._throttle_streak = 0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        """Block until another request may be sent"""
+        with self._cond:
+            while True:
+                pause = self._resume_at - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= self.limit:
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+    
+    def release(self, response=None):
+        """Finish a request, adapting concurrency and pacing to its response"""
+        with self._cond:
+            self._in_flight -= 1
+            if response is not None:
+                if response.status_code == 429:
+                    self._throttled(response)
+                else:
+                    self._throttle_streak = 0
+                    if self.limit < self.max_limit:
+                        self.limit += 1
+                    self._check_budget(response)
+            self._cond.notify_all()
+    
+    def _throttled(self, response):
+        self.limit = max(self.min_limit, self.limit // 2)
+        
+        # Honor Retry-After, otherwise back off exponentially with +/-20% jitter
+        delay = self._header_seconds(response, 'Retry-After')
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * 2 ** self._throttle_streak)
+            delay *= random.uniform(0.8, 1.2)
+        self._throttle_streak += 1
+        
+        self._pause(delay)
+        logger.warning(f"Rate limited - reducing concurrency to {self.limit}, pausing {delay:.1f}s")
+    
+    def _check_budget(self, response):
+        remaining = self._header_seconds(response, 'X-RateLimit-Remaining')
+        if remaining is None or remaining >= self.low_remaining:
+            return
+        
+        # X-RateLimit-Reset may be an epoch timestamp or seconds until reset
+        reset = self._header_seconds(response, 'X-RateLimit-Reset') or self.base_delay
+        if reset > 1e9:
+            reset -= time.time()
+        delay = min(self.max_delay, max(0.0, reset))
+        
+        self._pause(delay)
+        logger.info(f"Rate limit nearly exhausted ({int(remaining)} left) - pausing {delay:.1f}s")
+    
+    def _pause(self, delay):
+        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+    
+    @staticmethod
+    def _header_seconds(response, name):
+        try:
+            return float(response.headers[name])
+        except (KeyError, ValueError):
+            return None
+
+
 class NYCDataFetcher:
-    def __init__(self):
+    # Fields requested from the API ($select) - only what the pipeline uses
+    columns = [
+        'borough', 'neighborhood', 'building_class_category', 'tax_class_at_time_of_sale',
+        'block', 'lot', 'address', 'apartment_number', 'zip_code',
+        'residential_units', 'commercial_units', 'total_units',
+        'land_square_feet', 'gross_square_feet', 'year_built',
+        'sale_price', 'sale_date'
+    ]
+    
+    def __init__(self, app_token=None, max_workers=8):
         # NYC Open Data API endpoints
         self.base_url = "https://data.cityofnewyork.us/resource"
-        self.sales_endpoint = "usep-8jbt.json"  # NYC Citywide Rolling Calendar Sales
+        self.sales_endpoint = "usep-8jbt.csv"  # NYC Citywide Rolling Calendar Sales
+        self.stats_endpoint = "usep-8jbt.json"  # Same dataset, for SoQL aggregates
+        self.metadata_url = "https://data.cityofnewyork.us/api/views/usep-8jbt.json"
         
         # Directory setup
         self.data_dir = Path("data/raw")
         self.data_dir.mkdir(parents=True, exist_ok=True)
         
+        # Conditional-GET cache: ETags per request plus the payloads they validate
+        self.etag_cache_path = self.data_dir / ".etag_cache.json"
+        self.http_cache_dir = self.data_dir / ".http_cache"
+        self.http_cache_dir.mkdir(exist_ok=True)
+        self.etag_cache = self._load_etag_cache()
+        self._etag_lock = threading.Lock()
+        self._used_cache_keys = set()  # entries requested this run; the rest are pruned
+        
+        # Dataset metadata is reused for a day before it is re-validated
+        self.metadata_ttl = 24 * 60 * 60  # seconds
+        
+        # Incremental fetch: only sales after the stored data's watermark are downloaded.
+        # Recent weeks are re-requested because sales are often recorded late.
+        # The date range each file was fetched for is kept in its Parquet metadata.
+        self.standard_path = self.data_dir / "nyc_property_sales.parquet"
+        self.refetch_days = 30
+        self.covered_start, self.covered_end, self.watermark = self._load_watermark()
+        
         # API parameters
         self.limit = 50000  # Records per request (API maximum)
         self.timeout = 30  # Request timeout in seconds
+        self.max_workers = max_workers  # Concurrent page requests
+        self.max_attempts = 5  # Attempts per page when rate limited
+        
+        # Shared HTTP session - keep-alive reuses the TLS connection across pages.
+        # 429s (and Retry-After) are left to the AdaptiveLimiter so every thread backs off.
+        self.session = requests.Session()
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET"],
+            respect_retry_after_header=False
+        )
+        # One pooled connection per worker, otherwise urllib3 discards (and later
+        # re-handshakes) connections whenever every worker is busy
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": ACCEPT_ENCODING})
+        self._logged_encoding = False
+        if app_token:
+            self.session.headers['X-App-Token'] = app_token
+        
+        self.limiter = AdaptiveLimiter(max_limit=self.max_workers)
+    
+    def _load_etag_cache(self):
+        """Load the ETag cache written by previous runs"""
+        if self.etag_cache_path.exists():
+            try:
+                return json.loads(self.etag_cache_path.read_text())
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable ETag cache: {str(e)}")
+        return {}
+    
+    def _load_watermark(self):
+        """
+        Return the requested date range the stored data covers and its latest sale_date
+        
+        Returns:
+            (covered_start, covered_end, watermark), or (None, None, None) when there
+            is no usable stored data (files written before the range was recorded
+            included)
+        """
+        if not self.standard_path.exists():
+            return None, None, None
+        
+        try:
+            metadata = pq.read_metadata(self.standard_path).metadata or {}
+            sale_dates = pd.read_parquet(self.standard_path, columns=['sale_date'])['sale_date']
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable existing data: {str(e)}")
+            return None, None, None
+        
+        if b'covered_start' not in metadata or sale_dates.empty:
+            return None, None, None
+        return (pd.Timestamp(metadata[b'covered_start'].decode()),
+                pd.Timestamp(metadata[b'covered_end'].decode()),
+                sale_dates.max())
+    
+    def _save_etag_cache(self, prune=False):
+        """
+        Persist the ETag cache for the next run
+        
+        With prune=True, entries and payloads not requested during this run are
+        dropped (the dataset metadata is always kept), so pages of ranges that are
+        no longer fetched don't pile up on disk.
+        """
+        with self._etag_lock:
+            if prune:
+                keep = self._used_cache_keys | {self._cache_key(self.metadata_url)}
+                self.etag_cache = {key: entry for key, entry in self.etag_cache.items() if key in keep}
+                for path in self.http_cache_dir.iterdir():
+                    if path.name not in keep:
+                        path.unlink(missing_ok=True)
+            self.etag_cache_path.write_text(json.dumps(self.etag_cache, indent=2))
+    
+    @staticmethod
+    def _cache_key(url, params=None):
+        """Cache key of a request - the SHA-1 of its full URL"""
+        request_url = requests.Request('GET', url, params=params).prepare().url
+        return hashlib.sha1(request_url.encode()).hexdigest()
+    
+    def _cached_get(self, url, params=None, headers=None):
+        """
+        GET a resource through the on-disk conditional-GET cache
+        
+        Sends If-None-Match when a cached copy exists. A 304 reuses the cached
+        payload; a 200 streams the (decoded) body to disk and records its ETag.
+        
+        Returns:
+            (response, path) - path to the payload, or None if the request failed
+        """
+        request_url = requests.Request('GET', url, params=params).prepare().url
+        key = self._cache_key(url, params)
+        path = self.http_cache_dir / key
+        
+        headers = dict(headers or {})
+        with self._etag_lock:
+            self._used_cache_keys.add(key)
+            entry = self.etag_cache.get(key)
+        if entry and path.exists():
+            headers['If-None-Match'] = entry['etag']
+        
+        # The context manager hands the streamed connection back to the
+        # pool even when the body is never read (304s, 429s, HTTP errors)
+        with self.session.get(
+            url, params=params, headers=headers, timeout=self.timeout, stream=True
+        ) as response:
+            if response.status_code == 304:
+                logger.info("Not modified - using cached copy")
+                os.utime(path)  # re-validated now - restarts any TTL based on the copy's age
+                return response, path
+            if not response.ok:
+                return response, None
+            
+            # Stream to a temp file so an interrupted download never replaces a good copy
+            response.raw.decode_content = True
+            tmp_path = path.with_suffix('.part')
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(response.raw, f)
+                decoded_bytes = f.tell()
+            tmp_path.replace(path)
+            
+            if not self._logged_encoding:
+                self._logged_encoding = True
+                encoding = response.headers.get('Content-Encoding', 'identity')
+                logger.info(f"Content-Encoding: {encoding} ({response.raw.tell():,} bytes on the wire, "
+                            f"{decoded_bytes:,} decoded)")
+        
+        etag = response.headers.get('ETag')
+        with self._etag_lock:
+            if etag:
+                self.etag_cache[key] = {'etag': etag, 'url': request_url}
+            else:
+                self.etag_cache.pop(key, None)
+        
+        return response, path
+    
+    def _limited_get(self, url, params=None, headers=None, cached=True):
+        """
+        GET under the adaptive rate limiter, retrying while the API throttles us
+        
+        Returns:
+            (response, path) - path is the cached payload, None when cached=False
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.limiter.acquire()
+            response = None
+            try:
+                if cached:
+                    response, path = self._cached_get(url, params=params, headers=headers)
+                else:
+                    response, path = self.session.get(url, params=params, headers=headers, timeout=self.timeout), None
+            finally:
+                self.limiter.release(response)
+            
+            if response.status_code != 429:
+                response.raise_for_status()
+                return response, path
+            
+            logger.warning(f"Request throttled (attempt {attempt}/{self.max_attempts})")
+        
+        response.raise_for_status()
+    
+    def fetch_total_count(self, start_date, end_date):
+        """Count the records in a date range with a single SoQL aggregate query"""
+        params = {
+            "$select": "count(*) AS n",
+            "$where": f"sale_date >= '{start_date}' AND sale_date <= '{end_date}'"
+        }
+        url = f"{self.base_url}/{self.stats_endpoint}"
+        response, _ = self._limited_get(url, params=params, cached=False)
+        
+        return int(response.json()[0]['n'])
     
-    def fetch_sales_data(self, start_date="2019-01-01", end_date=None, app_token=None):
+    @staticmethod
+    def _monthly_windows(start_date, end_date):
+        """Split a date range into calendar-month windows, newest first"""
+        start, window_end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        windows = []
+        while window_end >= start:
+            window_start = max(start, window_end.replace(day=1))
+            windows.append((f"{window_start:%Y-%m-%d}", f"{window_end:%Y-%m-%d}"))
+            window_end = window_start - timedelta(days=1)
+        return windows
+    
+    def _fetch_window(self, start_date, end_date, columns):
+        """
+        Fetch every record in a date window with keyset pagination
+        
+        Instead of $offset (which makes the server re-scan all earlier rows for
+        each page), every page resumes after the (sale_date, :id) of the last row
+        of the previous page, so each request costs the same.
+        
+        Returns:
+            List of page Arrow tables in sale_date DESC order
+        """
+        url = f"{self.base_url}/{self.sales_endpoint}"
+        schema = self._page_schema(columns)
+        pages = []
+        cursor = None
+        
+        while True:
+            where = f"sale_date >= '{start_date}' AND sale_date <= '{end_date}'"
+            if cursor:
+                last_date, last_id = cursor
+                where += f" AND (sale_date < '{last_date}' OR (sale_date = '{last_date}' AND :id > '{last_id}'))"
+            
+            # Build API query with SoQL (Socrata Query Language)
+            params = {
+                "$select": ",".join(columns + [':id']),
+                "$limit": self.limit,
+                "$where": where,
+                "$order": "sale_date DESC, :id"  # :id breaks ties within a day
+            }
+            
+            logger.info(f"Requesting {start_date} to {end_date} (page {len(pages) + 1})...")
+            _, path = self._limited_get(url, params=params, headers={'Accept': 'text/csv'})
+            page = self._read_page(path, schema)
+            
+            if page.num_rows:
+                last_date = page.column('sale_date')[-1].as_py()
+                cursor = (f"{last_date:%Y-%m-%dT%H:%M:%S}", page.column(':id')[-1].as_py())
+                pages.append(page.select(schema.names).cast(schema))
+            
+            # A short page is the last one
+            if page.num_rows < self.limit:
+                return pages
+    
+    def fetch_sales_data(self, start_date="2019-01-01", end_date=None, app_token=None, columns=None):
         """
         Fetch NYC property sales data from Socrata API
         
@@ -37,6 +432,8 @@ class NYCDataFetcher:
             start_date: Start date for data (YYYY-MM-DD format)
             end_date: End date for data (defaults to today)
             app_token: Optional Socrata app token for higher rate limits
+                (overrides the token given to the constructor)
+            columns: Fields to request (defaults to NYCDataFetcher.columns)
         
         Returns:
             DataFrame with sales data
@@ -47,95 +444,242 @@ class NYCDataFetcher:
         logger.info(f"Fetching NYC property sales data from {start_date} to {end_date}")
         logger.info("Using Socrata Open Data API")
         
-        all_data = []
-        offset = 0
-        total_fetched = 0
-        
-        # Build headers
-        headers = {}
         if app_token:
-            headers['X-App-Token'] = app_token
+            self.session.headers['X-App-Token'] = app_token
+        if 'X-App-Token' in self.session.headers:
             logger.info("Using app token for higher rate limits")
         
-        while True:
-            try:
-                # Build API query with SoQL (Socrata Query Language)
-                params = {
-                    "$limit": self.limit,
-                    "$offset": offset,
-                    "$where": f"sale_date >= '{start_date}' AND sale_date <= '{end_date}'",
-                    "$order": "sale_date DESC"
-                }
-                
-                # Make API request
-                url = f"{self.base_url}/{self.sales_endpoint}"
-                logger.info(f"Requesting records {offset} to {offset + self.limit}...")
-                
-                response = requests.get(url, params=params, headers=headers, timeout=self.timeout)
-                response.raise_for_status()
-                
-                # Parse JSON response
-                data = response.json()
-                
-                if not data:
-                    logger.info("No more records to fetch")
-                    break
-                
-                all_data.extend(data)
-                total_fetched += len(data)
-                logger.info(f"Fetched {len(data)} records (Total: {total_fetched:,})")
-                
-                # Check if we got fewer records than limit (last page)
-                if len(data) < self.limit:
-                    logger.info("Reached end of dataset")
-                    break
-                
-                offset += self.limit
-                
-                # Be nice to the API - small delay between requests
-                time.sleep(0.5)
-                
-            except requests.exceptions.RequestException as e:
-                logger.error(f"API request failed: {str(e)}")
-                if offset > 0:
-                    logger.info(f"Returning {total_fetched:,} records fetched so far")
-                    break
-                else:
-                    raise
+        # Only download the fields we need; sale_date drives sorting and parsing
+        columns = list(columns or self.columns)
+        if 'sale_date' not in columns:
+            columns.append('sale_date')
         
-        # Convert to DataFrame
-        df = pd.DataFrame(all_data)
-        logger.info(f"Successfully fetched {len(df):,} total records")
+        # Resume from the stored watermark when the range the stored data was
+        # fetched for includes start_date
+        fetch_start = start_date
+        incremental = (self.watermark is not None
+                       and self.covered_start <= pd.Timestamp(start_date) <= self.covered_end)
+        if incremental:
+            resume = (self.watermark - timedelta(days=self.refetch_days)).strftime("%Y-%m-%d")
+            fetch_start = max(start_date, resume)
+            if fetch_start > end_date:
+                # The whole range is older than the refetch window - nothing to download
+                logger.info(f"Stored data already covers {start_date} to {end_date}")
+                df = self._read_parquet(self.standard_path)
+                in_range = df['sale_date'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))
+                return df[in_range].reset_index(drop=True)
+            logger.info(f"Existing data runs to {self.watermark:%Y-%m-%d} - fetching from {fetch_start}")
         
-        # Save raw data
+        # Probe the row count once, then fetch month windows concurrently
+        total = self.fetch_total_count(fetch_start, end_date)
+        windows = self._monthly_windows(fetch_start, end_date) if total else []
+        logger.info(f"{total:,} matching records across {len(windows)} monthly windows")
+        
+        # Stream pages into the Parquet snapshot as they arrive instead of
+        # holding every page in memory for one big concat
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"nyc_property_sales_{start_date}_{end_date}_{timestamp}.csv"
+        filename = f"nyc_property_sales_{fetch_start}_{end_date}_{timestamp}.parquet"
         filepath = self.data_dir / filename
         
-        df.to_csv(filepath, index=False)
+        writer = None
+        total_fetched = 0
+        complete = True
+        covered_start = fetch_start
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Keep a bounded look-ahead of windows in flight - submitting them all
+                # up front would leave every later window in memory while a slow
+                # newest one holds up the (in order) writes
+                remaining = iter(windows)
+                futures = deque(
+                    executor.submit(self._fetch_window, window_start, window_end, columns)
+                    for window_start, window_end in islice(remaining, 2 * self.max_workers)
+                )
+                
+                # Write newest window first so the file keeps the API's sort order
+                for index in range(len(windows)):
+                    future = futures.popleft()
+                    try:
+                        window_pages = future.result()
+                    except requests.exceptions.RequestException as e:
+                        logger.error(f"API request failed: {str(e)}")
+                        # Don't let the executor wait for windows we won't use
+                        for pending in futures:
+                            pending.cancel()
+                        if index > 0:
+                            logger.info(f"Returning {total_fetched:,} records fetched so far")
+                            complete = False
+                            # Only the windows already written are covered
+                            covered_start = windows[index - 1][0]
+                            break
+                        else:
+                            raise
+                    
+                    fetched = 0
+                    while window_pages:
+                        # Popping frees each table once written - the future holds this
+                        # same list, so otherwise every window would stay in memory
+                        # until the executor is done
+                        table = window_pages.pop(0)
+                        if writer is None:
+                            writer = pq.ParquetWriter(filepath, table.schema, compression='zstd')
+                        writer.write_table(table)
+                        fetched += table.num_rows
+                        del table
+                    
+                    total_fetched += fetched
+                    logger.info(f"Fetched {fetched} records (Total: {total_fetched:,})")
+                    
+                    # One window written, so the next one can start
+                    for window_start, window_end in islice(remaining, 1):
+                        futures.append(executor.submit(self._fetch_window, window_start, window_end, columns))
+        finally:
+            if writer is not None:
+                writer.add_key_value_metadata(self._coverage(covered_start, end_date))
+                writer.close()
+        
+        self._save_etag_cache(prune=True)
+        
+        if writer is None:
+            # Same dtypes as a non-empty fetch, so the snapshot schema and merges match
+            df = self._page_schema(columns).empty_table().to_pandas()
+            self._write_parquet(df, filepath, self._coverage(covered_start, end_date))
+            df = self._categorize(df)
+        else:
+            df = self._categorize(self._read_parquet(filepath))
+        logger.info(f"Successfully fetched {len(df):,} total records")
         logger.info(f"Raw data saved to: {filepath}")
         
-        # Also save as the standard filename for the pipeline
-        standard_path = self.data_dir / "nyc_property_sales.csv"
-        df.to_csv(standard_path, index=False)
-        logger.info(f"Data also saved as: {standard_path}")
+        if incremental:
+            if not complete:
+                # Merging a partial fetch would move the watermark past the missing pages
+                logger.warning(f"Fetch incomplete - leaving {self.standard_path} unchanged")
+                return df
+            
+            # Save the merged history as the standard filename for the pipeline.
+            # Written aside and renamed, so a snapshot hardlinked to the old file
+            # is never overwritten and a failed write never loses the history.
+            df = self._merge_with_history(df, fetch_start, end_date)
+            covered_start = self.covered_start.strftime("%Y-%m-%d")
+            covered_end = max(end_date, self.covered_end.strftime("%Y-%m-%d"))
+            tmp_path = self.standard_path.with_suffix('.parquet.part')
+            self._write_parquet(df, tmp_path, self._coverage(covered_start, covered_end))
+            tmp_path.replace(self.standard_path)
+        else:
+            # Same rows as the snapshot - hardlink it (same inode, no extra bytes),
+            # copying only where the filesystem has no hardlinks. Linked under a
+            # temp name and renamed, so the old file stays until the new one exists.
+            tmp_path = self.standard_path.with_suffix('.parquet.part')
+            tmp_path.unlink(missing_ok=True)
+            try:
+                os.link(filepath, tmp_path)
+            except OSError:
+                shutil.copyfile(filepath, tmp_path)
+            tmp_path.replace(self.standard_path)
+            covered_end = end_date
+        logger.info(f"Data also saved as: {self.standard_path}")
+        self.covered_start, self.covered_end = pd.Timestamp(covered_start), pd.Timestamp(covered_end)
+        self.watermark = df['sale_date'].max() if len(df) else None
+        
+        # Return only the requested range even when the stored history is wider
+        in_range = df['sale_date'].between(pd.Timestamp(start_date), pd.Timestamp(end_date))
+        return df[in_range].reset_index(drop=True)
+    
+    def _merge_with_history(self, df, fetch_start, end_date):
+        """Replace the refetched date range of the stored data with the newly fetched sales"""
+        history = self._read_parquet(self.standard_path)
+        # The fresh fetch is authoritative for its range - this also drops sales
+        # deleted upstream, and keeps distinct sales that share a date and lot
+        refetched = history['sale_date'].between(pd.Timestamp(fetch_start), pd.Timestamp(end_date))
+        merged = pd.concat([history[~refetched], df], ignore_index=True)
+        merged = merged.sort_values('sale_date', ascending=False, kind='stable', ignore_index=True)
+        logger.info(f"Merged with stored data: {len(history):,} + {len(df):,} -> {len(merged):,} records")
         
+        return self._categorize(merged)
+    
+    @staticmethod
+    def _coverage(start_date, end_date):
+        """Parquet key-value metadata recording the date range a file was fetched for"""
+        return {'covered_start': str(start_date), 'covered_end': str(end_date)}
+    
+    @staticmethod
+    def _write_parquet(df, path, metadata):
+        """Write a DataFrame to Parquet with extra key-value metadata"""
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+        pq.write_table(table, path, compression='zstd')
+    
+    @staticmethod
+    def _read_parquet(path):
+        """Load a Parquet file with peak memory close to the final DataFrame size"""
+        # split_blocks skips consolidating columns into 2-D blocks, and self_destruct
+        # frees each Arrow column once converted instead of keeping both copies
+        table = pq.read_table(path)
+        return table.to_pandas(self_destruct=True, split_blocks=True)
+    
+    @staticmethod
+    def _page_schema(columns):
+        """Arrow schema for the page columns, with pandas metadata to restore dtypes on read"""
+        template = pd.DataFrame({
+            col: pd.Series(dtype=NUMERIC_DTYPES.get(col) or DTYPES.get(col, 'string'))
+            for col in columns
+        })
+        return pa.Schema.from_pandas(template, preserve_index=False)
+    
+    def _read_page(self, path, schema):
+        """Parse a cached CSV page into an Arrow table with pyarrow's C++ reader"""
+        convert_options = pacsv.ConvertOptions(column_types=schema, strings_can_be_null=True)
+        try:
+            return pacsv.read_csv(path, convert_options=convert_options)
+        except pa.ArrowInvalid as e:
+            # A malformed number - let pandas coerce it to missing instead of failing
+            logger.warning(f"Falling back to pandas for page {path.name}: {str(e)}")
+            dtypes = {col: dtype for col, dtype in DTYPES.items() if col != 'sale_date'}
+            page = self._coerce_numeric(pd.read_csv(path, dtype=dtypes, parse_dates=['sale_date']))
+            return pa.Table.from_pandas(page, preserve_index=False)
+    
+    @staticmethod
+    def _coerce_numeric(df):
+        """Convert numeric columns to their compact NUMERIC_DTYPES type"""
+        for col, dtype in NUMERIC_DTYPES.items():
+            if col not in df.columns:
+                continue
+            values = df[col]
+            if not pd.api.types.is_numeric_dtype(values):
+                # Formatted numbers like "$1,250,000" are recoverable - strip before parsing
+                values = values.astype('string').str.replace(r'[$,]', '', regex=True).str.strip()
+            numbers = pd.to_numeric(values, errors='coerce')
+            
+            lost = int((numbers.isna() & values.notna() & (values.astype('string') != '')).sum())
+            if lost:
+                logger.warning(f"{col}: {lost:,} non-numeric values set to missing")
+            df[col] = numbers.astype(dtype)
         return df
     
+    @staticmethod
+    def _categorize(df):
+        """Store low-cardinality columns as category"""
+        categories = {col: 'category' for col in CATEGORY_COLUMNS if col in df.columns}
+        return df.astype(categories)
+    
     def get_dataset_info(self):
         """Get metadata about the dataset"""
         try:
-            # Fetch dataset metadata
-            metadata_url = "https://data.cityofnewyork.us/api/views/usep-8jbt.json"
-            response = requests.get(metadata_url, timeout=self.timeout)
-            response.raise_for_status()
+            # Metadata only changes when the dataset is updated - reuse a recent copy
+            path = self.http_cache_dir / self._cache_key(self.metadata_url)
+            if path.exists() and time.time() - path.stat().st_mtime < self.metadata_ttl:
+                logger.info("Using cached dataset metadata")
+            else:
+                # Fetch dataset metadata (a 304 when unchanged since the last fetch)
+                response, path = self._cached_get(self.metadata_url)
+                response.raise_for_status()
+                self._save_etag_cache()
             
-            metadata = response.json()
+            metadata = json.loads(path.read_text())
             
             logger.info("Dataset Information:")
             logger.info(f"Name: {metadata.get('name', 'N/A')}")
             logger.info(f"Description: {metadata.get('description', 'N/A')[:200]}...")
-            logger.info(f"Rows: {metadata.get('rowsUpdatedAt', 'N/A')}")
             logger.info(f"Last Updated: {metadata.get('rowsUpdatedAt', 'N/A')}")
             
             # Get column information
@@ -151,6 +695,25 @@ class NYCDataFetcher:
             logger.error(f"Failed to fetch dataset metadata: {str(e)}")
             return None
     
+    def get_dataset_stats(self):
+        """Get the row count and sale date range with one small SoQL aggregate query"""
+        try:
+            params = {"$select": "count(*) AS n, min(sale_date) AS min_d, max(sale_date) AS max_d"}
+            url = f"{self.base_url}/{self.stats_endpoint}"
+            response, _ = self._limited_get(url, params=params, cached=False)
+            
+            stats = response.json()[0]
+            stats['n'] = int(stats['n'])
+            
+            logger.info(f"Rows: {stats['n']:,}")
+            logger.info(f"Sale Dates: {stats.get('min_d', 'N/A')} to {stats.get('max_d', 'N/A')}")
+            
+            return stats
+            
+        except Exception as e:
+            logger.error(f"Failed to fetch dataset stats: {str(e)}")
+            return None
+    
     def fetch_recent_data(self, days=365):
         """Fetch data from the last N days"""
         end_date = datetime.now()
@@ -162,6 +725,23 @@ class NYCDataFetcher:
         )
 
 
+def fetch_custom_range(fetcher):
+    """Prompt for a date range and fetch it"""
+    start = input("Enter start date (YYYY-MM-DD): ").strip()
+    end = input("Enter end date (YYYY-MM-DD) [default: today]: ").strip()
+    return fetcher.fetch_sales_data(start_date=start, end_date=end if end else None)
+
+
+# Menu options for main(): choice -> (description, fetch function)
+PRESETS = {
+    "1": ("Last 12 months (fastest, good for testing)", lambda fetcher: fetcher.fetch_recent_data(days=365)),
+    "2": ("Last 24 months (recommended for analysis)", lambda fetcher: fetcher.fetch_recent_data(days=730)),
+    "3": ("Since 2019 (comprehensive, may take 5-10 minutes)", lambda fetcher: fetcher.fetch_sales_data(start_date="2019-01-01")),
+    "4": ("Custom date range", fetch_custom_range),
+}
+DEFAULT_PRESET = "2"
+
+
 def main():
     """Main execution function"""
     print("=" * 60)
@@ -174,38 +754,24 @@ def main():
     # Optional: Get dataset information
     print("Fetching dataset information...")
     fetcher.get_dataset_info()
+    fetcher.get_dataset_stats()
     print()
     
     # Choose your data range
     print("Choose data fetching option:")
-    print("1. Last 12 months (fastest, good for testing)")
-    print("2. Last 24 months (recommended for analysis)")
-    print("3. Since 2019 (comprehensive, may take 5-10 minutes)")
-    print("4. Custom date range")
+    for key, (description, _) in PRESETS.items():
+        print(f"{key}. {description}")
     
-    choice = input("\nEnter choice (1-4) [default: 2]: ").strip() or "2"
+    choice = input(f"\nEnter choice (1-{len(PRESETS)}) [default: {DEFAULT_PRESET}]: ").strip() or DEFAULT_PRESET
     
     try:
-        if choice == "1":
-            logger.info("Fetching last 12 months of data...")
-            df = fetcher.fetch_recent_data(days=365)
+        if choice not in PRESETS:
+            logger.warning(f"Invalid choice, using default ({PRESETS[DEFAULT_PRESET][0]})")
+            choice = DEFAULT_PRESET
         
-        elif choice == "2":
-            logger.info("Fetching last 24 months of data...")
-            df = fetcher.fetch_recent_data(days=730)
-        
-        elif choice == "3":
-            logger.info("Fetching data since 2019...")
-            df = fetcher.fetch_sales_data(start_date="2019-01-01")
-        
-        elif choice == "4":
-            start = input("Enter start date (YYYY-MM-DD): ").strip()
-            end = input("Enter end date (YYYY-MM-DD) [default: today]: ").strip()
-            df = fetcher.fetch_sales_data(start_date=start, end_date=end if end else None)
-        
-        else:
-            logger.warning("Invalid choice, using default (last 24 months)")
-            df = fetcher.fetch_recent_data(days=730)
+        description, fetch = PRESETS[choice]
+        logger.info(f"Fetching: {description}")
+        df = fetch(fetcher)
         
         # Display summary
         print("\n" + "=" * 60)